@@ -1,182 +1,458 @@
+# matplotlibはOKボタンでmatplotlib版レンダラを使うときだけ必要なので、
+# コールドスタートを軽くするため各関数内で遅延importする
 import streamlit as st
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
 import io
 import os
+import shutil
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
 
 # --- 1. フォント設定 (Streamlit Cloudでの日本語化) ---
-@st.cache_resource
+# フルのNoto CJKは約16MBあり初回ダウンロードで数秒かかる。使う文字は
+# 見出し・ヘッダーの固定セットだけなので、サブセット版を同梱すれば
+# ダウンロード自体を省略できる。生成例:
+#   pyftsubset NotoSansCJKjp-Bold.otf \
+#       --text="0123456789,+枚G台番機種名ゲーム数優秀BIGREATⅯ 🎰" \
+#       --output-file=NotoSansJP-Subset.ttf
+FONT_SUBSET_PATH = "NotoSansJP-Subset.ttf"
+FONT_FULL_PATH = "NotoSansJP-Bold.ttf"
+FONT_URL = "https://github.com/googlefonts/noto-cjk/raw/main/Sans/OTF/Japanese/NotoSansCJKjp-Bold.otf"
+
+def resolve_font_path():
+    # サブセット版があれば優先し、なければ従来どおりフル版をダウンロード
+    if os.path.exists(FONT_SUBSET_PATH):
+        return FONT_SUBSET_PATH
+    if not os.path.exists(FONT_FULL_PATH):
+        # タイムアウト付きでストリーム保存（urlretrieveはタイムアウト指定不可）
+        with urllib.request.urlopen(FONT_URL, timeout=30) as resp, \
+                open(FONT_FULL_PATH, 'wb') as f:
+            shutil.copyfileobj(resp, f)
+    return FONT_FULL_PATH
+
+@st.cache_resource(show_spinner=False)
 def setup_plt_font():
+    import matplotlib.pyplot as plt
+    import matplotlib.font_manager as fm
+
     # Boldを使用することで視認性を高めます
-    font_path = "NotoSansJP-Bold.ttf"
-    font_url = "https://github.com/googlefonts/noto-cjk/raw/main/Sans/OTF/Japanese/NotoSansCJKjp-Bold.otf"
-    
-    if not os.path.exists(font_path):
-        try:
-            urllib.request.urlretrieve(font_url, font_path)
-        except Exception as e:
-            st.error(f"フォントのダウンロードに失敗しました: {e}")
-            return None
+    try:
+        font_path = resolve_font_path()
+    except Exception as e:
+        # ダウンロードできなくてもインストール済みの日本語フォントで代替する。
+        # ttflistは大きいので部分一致の線形探索ではなく名前集合でO(1)照合
+        installed = {f.name for f in fm.fontManager.ttflist}
+        for candidate in ['Noto Sans CJK JP', 'Noto Sans JP', 'IPAexGothic',
+                          'Yu Gothic', 'Hiragino Sans', 'MS Gothic']:
+            if candidate in installed:
+                plt.rcParams['font.family'] = candidate
+                return fm.FontProperties(family=candidate)
+        st.error(f"フォントのダウンロードに失敗しました: {e}")
+        return None
 
+    # cache_resourceによりプロセスごとに1回だけ登録される
     fm.fontManager.addfont(font_path)
     prop = fm.FontProperties(fname=font_path)
     plt.rcParams['font.family'] = prop.get_name()
     return prop
 
-# --- 2. データ抽出ロジック ---
-def get_machine_rows(df, csv_name, display_name, threshold):
-    target_col = '機種名（データサイト表記）'
-    if target_col not in df.columns:
-        return None
-        
-    m_df = df[df[target_col] == csv_name].copy()
-    e_df = m_df[m_df['差枚'] >= threshold].copy().sort_values('台番')
-    
+# --- 2. CSV読み込み（キャッシュ） ---
+def detect_encoding(raw_bytes):
+    # try/exceptでCSV全体を2回パースする代わりに、先頭サンプルだけで判定する
+    if raw_bytes.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    if raw_bytes.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16'
+
+    # サンプル末尾でマルチバイト文字が切れる可能性があるので数バイト落とす
+    sample = raw_bytes[:65536]
+    if len(raw_bytes) > 65536:
+        sample = sample[:-4]
+
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode('cp932')
+        return 'cp932'
+    except UnicodeDecodeError:
+        pass
+
+    # 最後の手段として判定ライブラリに任せる（未導入ならcp932扱い）
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(sample).best()
+        if best:
+            return best.encoding
+    except ImportError:
+        pass
+    return 'cp932'
+
+def read_csv_any(raw_bytes, enc):
+    # pyarrowエンジンはマルチスレッドでパースが数倍速い。cp932は直接渡せない
+    # のでutf-8へデコードしてから渡し、pyarrow未導入などの場合はCエンジンに戻す
+    try:
+        if enc == 'cp932':
+            return pd.read_csv(io.StringIO(raw_bytes.decode('cp932')), engine='pyarrow')
+        return pd.read_csv(io.BytesIO(raw_bytes), encoding=enc, engine='pyarrow')
+    except UnicodeDecodeError:
+        raise
+    except Exception:
+        return pd.read_csv(io.BytesIO(raw_bytes), encoding=enc)
+
+@st.cache_data(show_spinner=False)
+def load_csv(raw_bytes):
+    # バイト列をキーにキャッシュするので、ウィジェット操作の再実行では再パースされない
+    enc = detect_encoding(raw_bytes)
+    try:
+        df = read_csv_any(raw_bytes, enc)
+    except UnicodeDecodeError:
+        # 判定が外れた場合だけ従来のフォールバックに戻る
+        df = read_csv_any(raw_bytes, 'utf-8' if enc == 'cp932' else 'cp932')
+
+    # int64のままだとマスク・ソートの帯域が無駄なので小さい整数型に落とす
+    for col in ['台番', 'G数', 'BB', 'RB', 'ART', '差枚']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+
+    # 機種名はcategory化すると比較が文字列ではなく整数コードで済む
+    if '機種名（データサイト表記）' in df.columns:
+        df['機種名（データサイト表記）'] = df['機種名（データサイト表記）'].astype('category')
+    return df
+
+@st.cache_data(show_spinner=False)
+def get_machine_names(raw_bytes):
+    # タプルで返すとキャッシュヒット時のコピーも安い
+    # category化済みなのでcategoriesから即座に取れる（再ハッシュ不要）
+    df = load_csv(raw_bytes)
+    return tuple(df['機種名（データサイト表記）'].cat.categories)
+
+# --- 3. データ抽出ロジック ---
+HEADER_ROW = ['台番', '機種名', 'ゲーム数', 'BIG', 'REG', 'AT', '差枚数']
+
+def format_thousands(s):
+    # '{:,}'.formatの要素ごと呼び出しは遅いので、通常の値域(0〜999,999)は
+    # 整数演算とzfillだけでカンマを入れる。範囲外が混ざるときだけ従来方式
+    s = s.astype('int64')
+    if len(s) == 0 or (s < 0).any() or (s >= 1_000_000).any():
+        return s.map('{:,}'.format)
+    high = s // 1000
+    out = high.astype(str) + ',' + (s % 1000).astype(str).str.zfill(3)
+    return out.where(high > 0, s.astype(str))
+
+def get_machine_rows(m_df, display_name, threshold):
+    # m_dfは機種名で絞り込み済みのグループ。データ行だけを返し、
+    # 見出し行・ヘッダー行の付与とインデックス管理は呼び出し側に任せる
+    e_df = m_df[m_df['差枚'] >= threshold].sort_values('台番')
+
     if e_df.empty:
         return None
-    
-    rows = []
-    rows.append([""] * 7) # 見出し行用（インデックス保持）
-    rows.append(['台番', '機種名', 'ゲーム数', 'BIG', 'REG', 'AT', '差枚数'])
-    
-    for _, row in e_df.iterrows():
-        rows.append([
-            str(row['台番']),
-            display_name,
-            f"{int(row['G数']):,}G",
-            str(int(row['BB'])),
-            str(int(row['RB'])),
-            str(int(row['ART'])),
-            f"+{int(row['差枚']):,}枚"
-        ])
-    return rows
-
-# --- 3. アプリUI ---
+
+    # iterrowsは行ごとにSeriesを生成して遅いため、列単位の一括フォーマットに変更
+    daiban = e_df['台番'].astype(str)
+    g_num = format_thousands(e_df['G数']) + 'G'
+    big = e_df['BB'].astype(int).astype(str)
+    reg = e_df['RB'].astype(int).astype(str)
+    at = e_df['ART'].astype(int).astype(str)
+    samai = '+' + format_thousands(e_df['差枚']) + '枚'
+
+    return list(
+        map(list, zip(daiban, [display_name] * len(e_df), g_num, big, reg, at, samai))
+    )
+
+# --- 4. 表の描画 ---
+# matplotlibのTableはセルごとにArtistを生成するため大きな表では重い。
+# 既定はPILの直接描画。比較やレイアウト検証にはFalseでmatplotlib版に戻せる
+USE_PIL_RENDERER = True
+
+def render_table_mpl(master_rows, headline_indices, header_indices, separator_indices, machine_info,
+                     dpi=100):
+    import matplotlib.pyplot as plt
+
+    font_prop = setup_plt_font()
+    fig, ax = plt.subplots(figsize=(16, len(master_rows) * 0.8), dpi=dpi)
+    # 行数からサイズが確定しているので、bbox_inches='tight'の測定用
+    # 再レンダリングに頼らず余白を直接ゼロにする
+    fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
+    # closeしないとFigureがpyplot内部に残り、クリックのたびにメモリが増え続ける
+    try:
+        return _draw_table_mpl(fig, ax, master_rows, headline_indices,
+                               header_indices, separator_indices, machine_info,
+                               font_prop)
+    finally:
+        plt.close(fig)
+
+def _draw_table_mpl(fig, ax, master_rows, headline_indices, header_indices, separator_indices, machine_info,
+                    font_prop):
+    ax.axis('off')
+
+    table = ax.table(
+        cellText=master_rows,
+        colWidths=[0.1, 0.2, 0.15, 0.1, 0.1, 0.1, 0.25],
+        loc='center',
+        cellLoc='center'
+    )
+    table.auto_set_font_size(False)
+    table.scale(1.0, 3.8) # 行の高さ調整
+
+    # 行の役割をint8コードに前計算し、ループ内の条件分岐をテーブル参照に置き換える
+    # 0=見出し, 1=ヘッダー, 2=余白, 3=データ偶数行, 4=データ奇数行
+    row_style = np.where(np.arange(len(master_rows)) % 2 == 0, 3, 4).astype(np.int8)
+    row_style[list(headline_indices)] = 0
+    row_style[list(header_indices)] = 1
+    row_style[list(separator_indices)] = 2
+
+    headline_map = {row: machine_info[i] for i, row in enumerate(headline_indices)}
+
+    # 役割ごとにセルをまとめてから、分岐のないループで一括スタイル適用する
+    buckets = ([], [], [], [], [])
+    for key, cell in table.get_celld().items():
+        buckets[row_style[key[0]]].append((key, cell))
+
+    # 見出し（赤帯）の設定
+    for (r, c), cell in buckets[0]:
+        cell.set_facecolor('#FF4B4B')
+        cell.set_edgecolor('#FF4B4B')
+        if c == 3: # 4列目にテキストを配置
+            txt = cell.get_text()
+            txt.set_text(f"{headline_map[r]} 優秀台")
+            if font_prop:
+                txt.set_fontproperties(font_prop)
+            txt.set_fontsize(24)
+            txt.set_weight('bold')
+            txt.set_color('black')
+            # 文字がセルの幅で切れないように設定
+            txt.set_clip_on(False)
+        else:
+            cell.get_text().set_text("")
+
+        # 見出しの枠線を繋げて一本の帯に見せる
+        if c == 0: cell.visible_edges = 'TLB'
+        elif c == 6: cell.visible_edges = 'TRB'
+        else: cell.visible_edges = 'TB'
+
+    # ヘッダー（黒）
+    for _, cell in buckets[1]:
+        cell.set_facecolor('#444444')
+        cell.set_edgecolor('#444444')
+        txt = cell.get_text()
+        txt.set_color('white')
+        txt.set_weight('bold')
+        txt.set_fontsize(20)
+
+    # 機種間の余白
+    for _, cell in buckets[2]:
+        cell.set_facecolor('white')
+        cell.set_height(0.01)
+        cell.visible_edges = ''
+        cell.get_text().set_text("")
+
+    # データ行（偶数行は薄灰、奇数行は白）
+    for code, color in ((3, '#F2F2F2'), (4, 'white')):
+        for _, cell in buckets[code]:
+            cell.set_facecolor(color)
+            cell.get_text().set_fontsize(18)
+
+    # savefigのデフォルト圧縮(zlibレベル6)はエンコードが重いので、
+    # キャンバスをPILに渡して呼び出し元でエンコードする
+    fig.canvas.draw()
+    img = Image.frombuffer(
+        'RGBA', fig.canvas.get_width_height(), fig.canvas.buffer_rgba()
+    )
+    return img
+
+def render_table_pil(master_rows, headline_indices, header_indices, separator_indices, machine_info,
+                     font_path=None, dpi=100):
+    # 全セルのスタイルが事前に決まっているので、矩形とテキストを直接描くだけで済む
+    from PIL import ImageDraw, ImageFont
+
+    W = 16 * dpi           # 16インチ相当
+    ROW_H = int(0.8 * dpi)
+    SEP_H = max(dpi // 10, 4)
+    col_widths = [0.1, 0.2, 0.15, 0.1, 0.1, 0.1, 0.25]
+    xs = [0]
+    for w in col_widths:
+        xs.append(xs[-1] + int(w * W))
+    xs[-1] = W
+
+    headline_map = {row: machine_info[i] for i, row in enumerate(headline_indices)}
+    header_set = set(header_indices)
+    separator_set = set(separator_indices)
+
+    heights = [SEP_H if r in separator_set else ROW_H for r in range(len(master_rows))]
+    img = Image.new('RGB', (W, sum(heights)), 'white')
+    draw = ImageDraw.Draw(img)
+
+    try:
+        font_path = font_path or resolve_font_path()
+        f_headline = ImageFont.truetype(font_path, W // 48)
+        f_header = ImageFont.truetype(font_path, W // 57)
+        f_data = ImageFont.truetype(font_path, W // 63)
+    except OSError:
+        f_headline = f_header = f_data = ImageFont.load_default()
+
+    y = 0
+    for r, row in enumerate(master_rows):
+        h = heights[r]
+        if r in headline_map:
+            draw.rectangle([0, y, W, y + h], fill='#FF4B4B')
+            draw.text((W // 2, y + h // 2), f"{headline_map[r]} 優秀台",
+                      font=f_headline, fill='black', anchor='mm')
+        elif r in header_set:
+            draw.rectangle([0, y, W, y + h], fill='#444444')
+            for c, text in enumerate(row):
+                draw.text(((xs[c] + xs[c + 1]) // 2, y + h // 2), text,
+                          font=f_header, fill='white', anchor='mm')
+        elif r in separator_set:
+            pass
+        else:
+            draw.rectangle([0, y, W, y + h], fill='#F2F2F2' if r % 2 == 0 else 'white')
+            for c, text in enumerate(row):
+                draw.text(((xs[c] + xs[c + 1]) // 2, y + h // 2), text,
+                          font=f_data, fill='black', anchor='mm')
+            draw.line([0, y + h, W, y + h], fill='#CCCCCC', width=2)
+        y += h
+    return img
+
+@st.cache_data
+def render_report(raw_bytes, targets, out_format, dpi):
+    # 入力（CSVバイト列・機種設定・形式・DPI）が同じなら再計算せず
+    # エンコード済みバイト列をそのまま返す
+    df = load_csv(raw_bytes)
+
+    # 3機種分を独立にスキャンせず、1回のisin + groupbyでまとめて絞り込む
+    target_col = '機種名（データサイト表記）'
+    sub = df[df[target_col].isin({csv_n for csv_n, _, _ in targets})]
+    # observed=Trueにしないとcategory化した列では全カテゴリ分の空グループが作られる
+    groups = {csv_n: grp for csv_n, grp in sub.groupby(target_col, sort=False, observed=True)}
+
+    # 1パス目: 各機種のブロックを取得
+    # マスク・ソート中はpandasがGILを解放するので、機種ごとの抽出は
+    # スレッドで並列化できる（結果はmapが入力順を保証する）
+    def extract(item):
+        i, (csv_n, disp_n, thresh) = item
+        grp = groups.get(csv_n)
+        res = get_machine_rows(grp, disp_n, thresh) if grp is not None else None
+        return i, disp_n, res
+
+    items = list(enumerate(targets))
+    if len(items) > 1:
+        with ThreadPoolExecutor(max_workers=len(items)) as ex:
+            results = list(ex.map(extract, items))
+    else:
+        results = [extract(item) for item in items]
+    blocks = [(i, disp_n, res) for i, disp_n, res in results if res]
+
+    if not blocks:
+        return None
+
+    # 2パス目: 合計行数が分かっているのでobject配列を先に確保してブロック単位で書き込む
+    machine_info = [disp_n for _, disp_n, _ in blocks]
+    headline_indices = []
+    header_indices = []
+    separator_indices = []
+    # ブロックごとに見出し行（空）+ ヘッダー行 + データ行を書き込む
+    total = sum(len(res) + 2 for _, _, res in blocks) + sum(1 for i, _, _ in blocks if i < 2)
+    master = np.empty((total, 7), dtype=object)
+    offset = 0
+    for i, _, res in blocks:
+        headline_indices.append(offset)
+        header_indices.append(offset + 1)
+        master[offset] = ""
+        master[offset + 1] = HEADER_ROW
+        master[offset + 2:offset + 2 + len(res)] = res
+        offset += len(res) + 2
+        if i < 2:
+            separator_indices.append(offset)
+            master[offset] = ""
+            offset += 1
+    # ax.tableはリストを要求するが、2次元object配列のtolistは1回のC呼び出しで済む
+    master_rows = master.tolist()
+
+    # 表の描画
+    render = render_table_pil if USE_PIL_RENDERER else render_table_mpl
+    img = render(master_rows, headline_indices, header_indices,
+                 separator_indices, machine_info, dpi=dpi)
+
+    # 画像の出力
+    buf = io.BytesIO()
+    if out_format == 'JPEG':
+        img.convert('RGB').save(buf, format='JPEG', quality=85)
+    elif out_format == 'WEBP':
+        # PNGよりエンコードが速くファイルも小さい（Pillow>=9.2）
+        img.save(buf, format='WEBP', quality=85)
+    else:
+        img.save(buf, format='PNG', compress_level=1)
+    return buf.getvalue()
+
+# --- 5. アプリUI ---
 st.set_page_config(page_title="優秀台表作成ツール v3", layout="centered")
 st.title("🎰 優秀台表作成アプリ")
 
-setup_plt_font()
-
 uploaded_file = st.file_uploader("CSVファイルをアップロードしてください", type=['csv'])
 
 if uploaded_file:
+    raw_bytes = uploaded_file.getvalue()
     try:
-        # エンコーディング対応
-        try:
-            df = pd.read_csv(uploaded_file, encoding='cp932')
-        except:
-            uploaded_file.seek(0)
-            df = pd.read_csv(uploaded_file, encoding='utf-8')
+        df = load_csv(raw_bytes)
     except Exception as e:
         st.error(f"CSV読み込み失敗: {e}")
         st.stop()
 
-    all_machines = df['機種名（データサイト表記）'].unique().tolist()
+    # 必須列はここで1回だけ検証する。設定を終えてから空の表になって
+    # 初めて気づく、という事態を防ぐ
+    missing = {'機種名（データサイト表記）', '台番', 'G数', 'BB', 'RB', 'ART', '差枚'} - set(df.columns)
+    if missing:
+        st.error(f"必要な列が見つかりません: {', '.join(sorted(missing))}")
+        st.stop()
+
+    all_machines = get_machine_names(raw_bytes)
     
     st.divider()
-    targets = []
-    for i in range(1, 4):
-        st.subheader(f"{i}機種目")
-        col1, col2, col3 = st.columns([2, 1, 1])
-        with col1:
-            csv_n = st.selectbox(f"CSV機種名", all_machines, key=f"csv_{i}")
-        with col2:
-            disp_n = st.text_input(f"表示略称", value=csv_n, key=f"disp_{i}")
-        with col3:
-            thresh = st.number_input(f"枚数条件", value=500, step=100, key=f"thresh_{i}")
-        targets.append((csv_n, disp_n, thresh))
+    # フォーム内のウィジェットは送信までrerunを起こさないので、
+    # 設定を1つ変えるたびにスクリプト全体が走り直すのを防げる
+    with st.form("machine_config"):
+        targets = []
+        for i in range(1, 4):
+            st.subheader(f"{i}機種目")
+            col1, col2, col3 = st.columns([2, 1, 1])
+            with col1:
+                csv_n = st.selectbox(f"CSV機種名", all_machines, key=f"csv_{i}")
+            with col2:
+                disp_n = st.text_input(f"表示略称", value=csv_n, key=f"disp_{i}")
+            with col3:
+                thresh = st.number_input(f"枚数条件", value=500, step=100, key=f"thresh_{i}")
+            targets.append((csv_n, disp_n, thresh))
+
+        st.divider()
+        # JPEGはPNGよりエンコードが速く転送量も小さい（劣化なしが必要ならPNG）
+        out_format = st.radio("出力形式", ["JPEG（推奨）", "WebP", "PNG"], horizontal=True)
+        # ピクセル数はdpiの2乗で増えるため、画面確認には100で十分
+        dpi = st.select_slider("画質（DPI）", options=[100, 150, 200], value=100)
+        submitted = st.form_submit_button("OK（表を作成）")
+
+    if submitted:
+        if out_format.startswith("JPEG"):
+            fmt, file_name, mime = 'JPEG', "syuseidai_report.jpg", "image/jpeg"
+        elif out_format == "WebP":
+            fmt, file_name, mime = 'WEBP', "syuseidai_report.webp", "image/webp"
+        else:
+            fmt, file_name, mime = 'PNG', "syuseidai_report.png", "image/png"
+        img_bytes = render_report(raw_bytes, tuple(targets), fmt, dpi)
+
+        if img_bytes:
+            st.image(img_bytes, use_container_width=True)
 
-    st.divider()
-    if st.button("OK（表を作成）"):
-        master_rows = []
-        headline_indices = []
-        header_indices = []
-        separator_indices = []
-        machine_info = []
-
-        for i, (csv_n, disp_n, thresh) in enumerate(targets):
-            res = get_machine_rows(df, csv_n, disp_n, thresh)
-            if res:
-                headline_indices.append(len(master_rows))
-                header_indices.append(len(master_rows) + 1)
-                machine_info.append(disp_n)
-                master_rows.extend(res)
-                if i < 2: 
-                    separator_indices.append(len(master_rows))
-                    master_rows.append([""] * 7)
-
-        if master_rows:
-            # グラフの作成
-            fig, ax = plt.subplots(figsize=(16, len(master_rows) * 0.8))
-            ax.axis('off')
-            
-            table = ax.table(
-                cellText=master_rows, 
-                colWidths=[0.1, 0.2, 0.15, 0.1, 0.1, 0.1, 0.25], 
-                loc='center', 
-                cellLoc='center'
-            )
-            table.auto_set_font_size(False)
-            table.scale(1.0, 3.8) # 行の高さ調整
-
-            cells = table.get_celld()
-            for (r, c), cell in cells.items():
-                # 見出し（赤帯）の設定
-                if r in headline_indices:
-                    cell.set_facecolor('#FF4B4B') 
-                    cell.set_edgecolor('#FF4B4B')
-                    if c == 3: # 4列目にテキストを配置
-                        m_idx = headline_indices.index(r)
-                        txt = cell.get_text()
-                        txt.set_text(f"{machine_info[m_idx]} 優秀台")
-                        txt.set_fontsize(24)
-                        txt.set_weight('bold')
-                        txt.set_color('black')
-                        # 文字がセルの幅で切れないように設定
-                        txt.set_clip_on(False)
-                    else:
-                        cell.get_text().set_text("")
-                    
-                    # 見出しの枠線を繋げて一本の帯に見せる
-                    if c == 0: cell.visible_edges = 'TLB'
-                    elif c == 6: cell.visible_edges = 'TRB'
-                    else: cell.visible_edges = 'TB'
-                
-                # ヘッダー（黒）
-                elif r in header_indices:
-                    cell.set_facecolor('#444444')
-                    cell.set_edgecolor('#444444')
-                    txt = cell.get_text()
-                    txt.set_color('white')
-                    txt.set_weight('bold')
-                    txt.set_fontsize(20)
-                
-                # 機種間の余白
-                elif r in separator_indices:
-                    cell.set_facecolor('white')
-                    cell.set_height(0.01)
-                    cell.visible_edges = ''
-                    cell.get_text().set_text("")
-                
-                # データ行
-                else:
-                    cell.set_facecolor('#F2F2F2' if r % 2 == 0 else 'white')
-                    cell.get_text().set_fontsize(18)
-
-            # 画像の出力
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', bbox_inches='tight', dpi=150)
-            buf.seek(0)
-            st.image(buf, use_container_width=True)
-            
             # ダウンロードボタン
             st.download_button(
                 label="画像をダウンロード",
-                data=buf.getvalue(),
-                file_name="syuseidai_report.png",
-                mime="image/png"
+                data=img_bytes,
+                file_name=file_name,
+                mime=mime
             )
         else:
             st.warning("条件に一致するデータが見つかりませんでした。")